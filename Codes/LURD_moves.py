@@ -1,4 +1,5 @@
 import os
+from Model_Smv import find_tunnels
 
 def automation_LURD_moves(filename):
     """
@@ -40,3 +41,48 @@ def automation_LURD_moves(filename):
         player_movements.append(last_movement_of_player)
 
     return player_movements[:-1]
+
+
+def expand_tunnel_moves(board, player_movements):
+    """
+    Expand the moves of a model with compressed tunnels (see find_tunnels) back to single cell moves.
+    The moves are played on the board, and each walk through an empty tunnel becomes one move per cell.
+    :param board: the initial board of the Sokoban game (as returned from read_from_file)
+    :param player_movements: list of player movements (LURD format) of the compressed model
+    :return: list of player movements (LURD format) of the regular game
+    """
+    directions = {'l': (0, -1), 'r': (0, 1), 'u': (-1, 0), 'd': (1, 0)}
+    tunnels = find_tunnels(board)
+
+    # the cells of the player and the boxes while the moves are played
+    player = [(i, j) for i in range(len(board)) for j in range(len(board[i])) if board[i][j] in ['@', '+']][0]
+    boxes = {(i, j) for i in range(len(board)) for j in range(len(board[i])) if board[i][j] in ['$', '*']}
+
+    expanded_movements = []
+
+    for move in player_movements:
+        di, dj = directions[move]
+
+        # walk through an empty tunnel that starts at the player's cell
+        tunnel = [cells for entrance, cells, tunnel_move in tunnels
+                  if entrance == player and tunnel_move == move and not boxes.intersection(cells)]
+        if tunnel:
+            expanded_movements += [move] * len(tunnel[0])
+            player = tunnel[0][-1]
+            continue
+
+        expanded_movements.append(move)
+
+        # a regular move - push the box in front of the player if the cell after it is free
+        front = (player[0] + di, player[1] + dj)
+        after = (player[0] + 2 * di, player[1] + 2 * dj)
+        if board[front[0]][front[1]] == '#':
+            continue
+        if front in boxes:
+            if board[after[0]][after[1]] == '#' or after in boxes:
+                continue
+            boxes.remove(front)
+            boxes.add(after)
+        player = front
+
+    return expanded_movements
@@ -1,8 +1,11 @@
 import run_nuXmv
 from Model_Smv import *
 import time
-from LURD_moves import automation_LURD_moves
-from solve_iteratively import solve_board_iteratively
+from LURD_moves import automation_LURD_moves, expand_tunnel_moves
+from solve_iteratively import solve_board_iteratively, solve_board_adaptively
+from bidirectional_search import solve_bidirectional
+from lower_bound import lower_bound
+from trace_archive import archive_run
 import scapy
 def main(is_iterative=False):
     ##### CHANGE HERE TO THE FULL BOARD PATH #####
@@ -10,23 +13,75 @@ def main(is_iterative=False):
     # ^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
 
     if not is_iterative:
+        # Compute a lower bound on the number of moves, and reject boards that can't be solved before running nuXmv
+        min_k = lower_bound(read_from_file(board_file))
+        if min_k is None:
+            print(f"************ There is no path to win - the {board_file} can't be solved! ************")
+            return
+        print(f"Lower bound on the number of moves for {board_file} is: {min_k}")
+
+        #### CHANGE HERE TO True TO SEARCH FORWARD FROM THE BOARD AND BACKWARD FROM THE GOALS AT THE SAME TIME ####
+        is_bidirectional = False
+        # ^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+
+        # The bidirectional search runs the SAT engine on the forward and the reverse models, each with about k/2
+        if is_bidirectional:
+            k = input("Enter k Value for BMC:")
+            if int(k) < min_k:
+                print(f"************ There is no path to win for {board_file} at this k value! ************")
+                return
+
+            player_movements = solve_bidirectional(board_file, k)
+
+            # If there's no path to winning, print a message, else print the path for winning:
+            if len(player_movements) == 0:
+                print(f"************ There is no path to win for {board_file} at this k value! ************")
+            else:
+                print("************ The Path for Win is: ************")
+                for move in player_movements:
+                    print(move)
+                print('Win :)')
+            return
+
+        #### CHANGE HERE TO True TO WALK THROUGH TUNNELS IN A SINGLE STEP OF THE MODEL ####
+        compress_tunnels = False
+        # ^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+
+        # A walk through a tunnel counts as one step of the model, so the lower bound on moves doesn't bound k
+        if compress_tunnels:
+            min_k = None
+
         # Generate the board from the file
-        board_file_name = gen_board(board_file)
+        board_file_name = gen_board(board_file, compress_tunnels=compress_tunnels)
 
         #### CHANGE HERE TO THE NAME OF THE ENGINE YOU WANT TO USE ####
         engine = "SAT"
         # ^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
 
+        #### CHANGE HERE TO True TO LET THE BDD ENGINE REORDER THE VARIABLES AND SAVE THE ORDER FOR THE NEXT RUNS ####
+        dynamic_reordering = False
+        # ^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+
         # If the engine is SAT, prompt the user to enter k value for BMC
         if engine == 'SAT':
             k = input("Enter k Value for BMC:")
+            if min_k is not None and int(k) < min_k:
+                print(f"************ There is no path to win for {board_file} at this k value! ************")
+                return
         else:
             k = None
 
+        # For the BDD engine, use a variable order that follows the board geometry (or one saved by an earlier run)
+        if engine == 'BDD':
+            order_file, save_order_file = gen_order_file(board_file, dynamic_reordering=dynamic_reordering)
+        else:
+            order_file, save_order_file = None, None
+
         # Record start time of running the model
         start_time = time.time()
         # Run nuXmv with specified parameters and get the output file name
-        output_file_name = run_nuXmv.run_nuxmv(board_file_name, k, engine)
+        output_file_name = run_nuXmv.run_nuxmv(board_file_name, k, engine, min_k=min_k, order_file=order_file,
+                                               save_order_file=save_order_file)
         # Record end time
         end_time = time.time()
 
@@ -37,6 +92,19 @@ def main(is_iterative=False):
         # Extract the LURD moves from the output sokoban file
         player_movements = automation_LURD_moves(r'C:\Users\shoham\Documents\ENG_degree\Final Project\nuXmv-2.0.0-win64\bin\sokoban_model.out')
 
+        # Expand the walks through the tunnels back to single moves
+        if compress_tunnels:
+            player_movements = expand_tunnel_moves(read_from_file(board_file), player_movements)
+
+        #### CHANGE HERE TO THE ARCHIVE TO SAVE THE RESULT IN (None TO SAVE ONLY THE .out FILE) ####
+        archive_file = 'sokoban_traces.arc'
+        # ^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+
+        # Save the result and the running time in the trace archive
+        if archive_file is not None:
+            with open(r'C:\Users\shoham\Documents\ENG_degree\Final Project\nuXmv-2.0.0-win64\bin\sokoban_model.out', 'r') as f:
+                archive_run(archive_file, f.read(), read_from_file(board_file), engine, [total_time], player_movements)
+
         # If there's no path to winning, print a message:
         if len(player_movements) == 0 and engine == 'SAT':
             print(f"************ There is no path to win for {board_file} at this k value! ************")
@@ -51,8 +119,21 @@ def main(is_iterative=False):
 
     # if iterative running
     else:
+        #### CHANGE HERE TO True TO CHECK ALL THE GOAL PREFIXES IN A SINGLE nuXmv RUN ####
+        multi_property = False
+        # ^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+
+        #### CHANGE HERE TO True TO ADD SEVERAL GOALS IN EACH ITERATION WHILE THE ITERATIONS ARE FAST ####
+        adaptive = False
+        time_budget = 60
+        # ^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+
         # Solve the Sokoban game iteratively
-        run_times = solve_board_iteratively(board_file)
+        if adaptive:
+            k = input("Enter k Value for BMC:")
+            run_times = solve_board_adaptively(board_file, k, time_budget)
+        else:
+            run_times = solve_board_iteratively(board_file, multi_property)
         for run_time, iteration in run_times:
             print(f"Time to run iteration {iteration} is: {run_time:.3f} seconds")
 
@@ -1,12 +1,18 @@
 import os
+import hashlib
 
-def create_smv_model (board):
+def create_smv_model (board, win_condition=None, compress_tunnels=False):
     """
     Create an SMV text file to be used with the nuXmv tool.
     :param board: the board of the current Sokoban game
+    :param win_condition: the condition of is_solvable, defaults to all the goals holding boxes
+    :param compress_tunnels: if True, walking through an empty tunnel is a single step (see find_tunnels)
     :return: the SMV model as a string
     """
 
+    if win_condition is None:
+        win_condition = define_solvability(board)
+
     n = len(board)
     m = len(board[0])
 
@@ -24,16 +30,61 @@ INIT
     
 -- Define transition rules for moving tiles
 ASSIGN
-    {define_transitions(board)}
+    {define_transitions(board, find_tunnels(board) if compress_tunnels else [])}
     
 -- Define a function to check solvability based on the condition that all goals . convert to *
 DEFINE
     is_solvable :=
-        {define_solvability(board)}
+        {win_condition}
         
 -- Specify properties to check solvability
 LTLSPEC !(F is_solvable);
 
+"""
+
+    return smv_model
+
+def create_reverse_smv_model(board, target_condition=None):
+    """
+    Create an SMV text file of the reverse (pull) game of the board.
+    The reverse game starts from all the goals holding boxes (extra boxes anywhere else) with the player anywhere on the floor,
+    and in each step the player moves and may pull the box behind it.
+    :param board: the board of the current Sokoban game
+    :param target_condition: the condition of is_solvable, defaults to reaching the initial board
+    :return: the SMV model as a string
+    """
+
+    n = len(board)
+    m = len(board[0])
+
+    if target_condition is None:
+        target_condition = define_state_condition(board)
+
+    smv_model = f"""
+MODULE main
+
+-- Define the puzzle state variables
+VAR
+    game_board: array 0..{n-1} of array 0..{m-1} of {{Wall, Player, PonGoal, Box, BonGoal, Goal, Floor}};
+    movement: {{r, l, u, d}}; --direction is non-determinisic
+    pull: boolean; --pulling the box behind the player is non-determinisic
+    
+-- Define the initial states - all the goals hold boxes and the player is on any floor cell
+INIT
+    {define_reverse_initial_states(board)}
+    
+-- Define transition rules for moving and pulling tiles
+ASSIGN
+    {define_reverse_transitions(board)}
+    
+-- Define a function to check that the target state of the reverse game is reached
+DEFINE
+    is_solvable :=
+        {target_condition}
+        
+-- Specify properties to check reachability of the target state
+LTLSPEC !(F is_solvable);
+
 """
 
     return smv_model
@@ -56,10 +107,18 @@ def read_from_file(path):
     :return: the board as a 2D list
     """
     with open(path, "r") as smv_model_file:
-        # Read each line from the file, convert it to a list of characters, and remove the '\n' character
-        board = [list(line.strip()) for line in smv_model_file if line.strip()]
+        return read_from_text(smv_model_file.read())
 
-        # Iterate through each list (row) in the board
+def read_from_text(board_text):
+    """
+    Read board from the XSB text of a board.
+    :param board_text: the text of the board
+    :return: the board as a 2D list
+    """
+    # Read each line from the text, convert it to a list of characters, and remove the '\n' character
+    board = [list(line.strip()) for line in board_text.split('\n') if line.strip()]
+
+    # Iterate through each list (row) in the board
     for lst in board:
         # Iterate through each element (character) in the list
         for i in range(len(lst)):
@@ -152,12 +211,79 @@ def define_initial_states(board, n, m):
     return str_initial
 
 
-def define_transitions(board):
+def find_tunnels(board):
+    """
+    Find the tunnels of the board - runs of at least two one-wide floor cells with walls on both sides.
+    Goals are never part of a tunnel, so the player has no reason to stop inside an empty tunnel.
+    :param board: the board of the current Sokoban game
+    :return: list of (entrance, cells, movement) - a player on the entrance cell that moves in the movement
+             direction walks through the cells, each tunnel appears once for each direction
+    """
+    directions = {'r': (0, 1), 'd': (1, 0)}
+    opposite = {'r': 'l', 'd': 'u'}
+    tunnels = []
+
+    def is_tunnel_cell(i, j, di, dj):
+        # the cells on both sides (across the direction) are walls and the cells along it are floor
+        return (is_floor(board, i, j) and board[i][j] not in ['.', '+', '*'] and
+                not is_floor(board, i + dj, j + di) and not is_floor(board, i - dj, j - di) and
+                is_floor(board, i + di, j + dj) and is_floor(board, i - di, j - dj))
+
+    for move, (di, dj) in directions.items():
+        for i in range(len(board)):
+            for j in range(len(board[0])):
+                # start a tunnel only on its first cell
+                if not is_tunnel_cell(i, j, di, dj) or is_tunnel_cell(i - di, j - dj, di, dj):
+                    continue
+
+                cells = [(i, j)]
+                while is_tunnel_cell(cells[-1][0] + di, cells[-1][1] + dj, di, dj):
+                    cells.append((cells[-1][0] + di, cells[-1][1] + dj))
+
+                if len(cells) >= 2:
+                    tunnels.append(((i - di, j - dj), cells, move))
+                    tunnels.append(((cells[-1][0] + di, cells[-1][1] + dj), cells[::-1], opposite[move]))
+
+    return tunnels
+
+def define_tunnel_transitions(tunnels, i, j):
+    """
+    Define the transition rules of walking through the tunnels in a single step.
+    The player on the entrance moves to the last cell of an empty tunnel and the first cell stays empty.
+    These rules come before the regular rules of the cell so they take over the single cell move.
+    :param tunnels: the tunnels of the board (see find_tunnels)
+    :param i: the row of the cell
+    :param j: the column of the cell
+    :return: the transition rules of the cell as a string
+    """
+    transitions = ''
+
+    for (entrance_i, entrance_j), cells, move in tunnels:
+        if (i, j) not in [cells[0], cells[-1]]:
+            continue
+
+        empty_tunnel = ' & '.join(f'game_board[{r}][{c}] = Floor' for r, c in cells)
+        condition = (f'(game_board[{entrance_i}][{entrance_j}] = Player | game_board[{entrance_i}][{entrance_j}] = PonGoal) & '
+                     f'movement = {move} & {empty_tunnel}')
+
+        transitions += f'\t\t\t--Walk through the tunnel {cells[0]} - {cells[-1]}\n'
+        if (i, j) == cells[-1]:
+            transitions += f'\t\t\t{condition}: Player;\n'
+        else:
+            transitions += f'\t\t\t{condition}: Floor;\n'
+
+    return transitions
+
+def define_transitions(board, tunnels=None):
     """
     Define the transition rules of the SMV model.
     :param board: the board of the current Sokoban game
+    :param tunnels: tunnels to walk through in a single step (see find_tunnels), defaults to none
     :return: the transition rules as a string
     """
+    if tunnels is None:
+        tunnels = []
+
     transitions = ''
     num_rows = len(board)
     num_cols = len(board[0])
@@ -168,6 +294,7 @@ def define_transitions(board):
                 transitions += f'next(game_board[{i}][{j}]) := Wall;\n\t'
             else:
                 transitions += f'next(game_board[{i}][{j}]) := \n\t\tcase\n'
+                transitions += define_tunnel_transitions(tunnels, i, j)
                 # MAYBE IN DEFAULT CASE
                 transitions += f'\t\t\t--Current @ V + next cell #\n'
                 transitions += f'\t\t\t(game_board[{i}][{j}] = Player | game_board[{i}][{j}] = PonGoal) & movement = l & game_board[{i}][{j - 1}] = Wall: game_board[{i}][{j}];\n'
@@ -376,6 +503,144 @@ def define_transitions(board):
 
     return transitions
 
+def cell_values(board, i, j):
+    """
+    Get the values of a cell when it's empty, holds the player or holds a box.
+    Goals never move, so each cell has only one value for each case.
+    :param board: the board of the current Sokoban game
+    :param i: the row of the cell
+    :param j: the column of the cell
+    :return: the empty, player and box values of the cell
+    """
+    if board[i][j] in ['.', '+', '*']:
+        return 'Goal', 'PonGoal', 'BonGoal'
+    return 'Floor', 'Player', 'Box'
+
+def is_floor(board, i, j):
+    """
+    Check if a cell is inside the board and isn't a wall.
+    :param board: the board of the current Sokoban game
+    :param i: the row of the cell
+    :param j: the column of the cell
+    :return: True if the player or a box can be on the cell
+    """
+    return 0 <= i < len(board) and 0 <= j < len(board[i]) and board[i][j] != '#'
+
+def define_reverse_initial_states(board):
+    """
+    Define the string of the initial states of the reverse game - the boxes are on all the goals,
+    the extra boxes (if any) are on other floor cells and the player is on one of the other floor cells.
+    :param board: the board of the current Sokoban game
+    :return: the initial states as a string
+    """
+    num_boxes = sum(row.count('$') + row.count('*') for row in board)
+    num_goals = sum(row.count('.') + row.count('+') + row.count('*') for row in board)
+    if num_boxes < num_goals:
+        raise ValueError("The reverse game needs a box for every goal")
+
+    str_initial = ''
+    player_cells = []
+    box_cells = []
+
+    for r in range(len(board)):
+        for c in range(len(board[0])):
+            if board[r][c] == '#':
+                str_initial += f'game_board[{r}][{c}] = Wall &\n\t'
+            elif board[r][c] in ['.', '+', '*']:
+                str_initial += f'game_board[{r}][{c}] = BonGoal &\n\t'
+            elif num_boxes > num_goals:
+                str_initial += (f'(game_board[{r}][{c}] = Floor | game_board[{r}][{c}] = Player | '
+                                f'game_board[{r}][{c}] = Box) &\n\t')
+                player_cells.append(f'game_board[{r}][{c}] = Player')
+                box_cells.append(f'game_board[{r}][{c}] = Box')
+            else:
+                str_initial += f'(game_board[{r}][{c}] = Floor | game_board[{r}][{c}] = Player) &\n\t'
+                player_cells.append(f'game_board[{r}][{c}] = Player')
+
+    # the boxes that aren't on goals can be on any of the other floor cells
+    if box_cells:
+        str_initial += f'count({", ".join(box_cells)}) = {num_boxes - num_goals} &\n\t'
+
+    # exactly one player on the board
+    str_initial += f'count({", ".join(player_cells)}) = 1;\n\t'
+
+    return str_initial
+
+def define_reverse_transitions(board):
+    """
+    Define the transition rules of the reverse (pull) game - they mirror define_transitions.
+    The player moves to an empty cell, and if pull is TRUE the box behind the player moves to the player's cell.
+    :param board: the board of the current Sokoban game
+    :return: the transition rules as a string
+    """
+    transitions = ''
+    directions = [('l', 0, -1), ('r', 0, 1), ('u', -1, 0), ('d', 1, 0)]
+
+    for i in range(len(board)):
+        for j in range(len(board[0])):
+            if board[i][j] == '#':
+                transitions += f'next(game_board[{i}][{j}]) := Wall;\n\t'
+                continue
+
+            empty, player, box = cell_values(board, i, j)
+            transitions += f'next(game_board[{i}][{j}]) := \n\t\tcase\n'
+
+            for move, di, dj in directions:
+                # the cell in front of the current cell, the one after it and the one behind it
+                front, after, behind = (i + di, j + dj), (i + 2 * di, j + 2 * dj), (i - di, j - dj)
+                transitions += f'\t\t\t--Player moves {move}\n'
+
+                if is_floor(board, *front):
+                    front_empty, front_player, _ = cell_values(board, *front)
+                    front_cell = f'game_board[{front[0]}][{front[1]}]'
+
+                    # the player of the current cell moves to the empty cell in front of it,
+                    # pulling the box behind it into the current cell
+                    if is_floor(board, *behind):
+                        behind_box = cell_values(board, *behind)[2]
+                        transitions += (
+                            f'\t\t\tgame_board[{i}][{j}] = {player} & movement = {move} & {front_cell} = {front_empty} & '
+                            f'pull & game_board[{behind[0]}][{behind[1]}] = {behind_box}: {box};\n')
+                    transitions += (
+                        f'\t\t\tgame_board[{i}][{j}] = {player} & movement = {move} & {front_cell} = {front_empty}: {empty};\n')
+
+                    # the box of the current cell is pulled by the player in front of it
+                    if is_floor(board, *after):
+                        after_empty = cell_values(board, *after)[0]
+                        transitions += (
+                            f'\t\t\tgame_board[{i}][{j}] = {box} & movement = {move} & {front_cell} = {front_player} & '
+                            f'pull & game_board[{after[0]}][{after[1]}] = {after_empty}: {empty};\n')
+
+                # the player behind the current cell moves into it
+                if is_floor(board, *behind):
+                    behind_player = cell_values(board, *behind)[1]
+                    transitions += (
+                        f'\t\t\tgame_board[{i}][{j}] = {empty} & movement = {move} & '
+                        f'game_board[{behind[0]}][{behind[1]}] = {behind_player}: {player};\n')
+
+                transitions += '\n'
+
+            # DEFAULT CASE
+            transitions += f'\n\t\t\t-- Default case\n'
+            transitions += f'\t\t\tTRUE: game_board[{i}][{j}];\n'
+            transitions += f'\t\tesac;\n'
+            transitions += '\n\t\t'
+
+    return transitions
+
+def define_state_condition(board):
+    """
+    Define the condition of being in the given board state (the walls are left out since they never change).
+    :param board: the board state to reach
+    :return: the condition as a string
+    """
+    xsb_to_cell = {'@': 'Player', '+': 'PonGoal', '$': 'Box', '*': 'BonGoal', '.': 'Goal', '-': 'Floor'}
+
+    conditions = [f'game_board[{r}][{c}] = {xsb_to_cell[board[r][c]]}'
+                  for r in range(len(board)) for c in range(len(board[0])) if board[r][c] != '#']
+
+    return ' & '.join(conditions) + ' ;'
+
 def define_solvability(board):
     """
     Define the solvability condition for the Sokoban game.
@@ -400,22 +665,116 @@ def define_solvability(board):
     return win_conditions
 
 
+def hilbert_index(row, col, size):
+    """
+    Compute the position of a cell along a Hilbert curve that covers a size x size grid.
+    Cells that are close on the board are close along the curve.
+    :param row: the row of the cell
+    :param col: the column of the cell
+    :param size: the size of the grid (a power of 2)
+    :return: the position of the cell along the curve
+    """
+    index = 0
+    s = size // 2
+    while s > 0:
+        rx = 1 if col & s else 0
+        ry = 1 if row & s else 0
+        index += s * s * ((3 * rx) ^ ry)
+
+        # rotate the quadrant so the curve stays continuous
+        if ry == 0:
+            if rx == 1:
+                row = size - 1 - row
+                col = size - 1 - col
+            row, col = col, row
+        s //= 2
+
+    return index
+
+def define_variable_order(board):
+    """
+    Define a BDD variable order from the geometry of the board.
+    The transitions of a cell only read its neighbours, so the non wall cells are ordered along a
+    space filling curve to keep neighbouring cells close in the order. The walls never change and come last.
+    :param board: the board of the current Sokoban game
+    :return: list of the variable names in order
+    """
+    n = len(board)
+    m = len(board[0])
+
+    size = 1
+    while size < max(n, m):
+        size *= 2
+
+    floor_cells = sorted(((r, c) for r in range(n) for c in range(m) if board[r][c] != '#'),
+                         key=lambda cell: hilbert_index(cell[0], cell[1], size))
+    wall_cells = [(r, c) for r in range(n) for c in range(m) if board[r][c] == '#']
+
+    # the movement is read by the transitions of all the cells
+    variables = ['movement']
+    variables += [f'game_board[{r}][{c}]' for r, c in floor_cells + wall_cells]
+
+    return variables
+
+def saved_order_name(board):
+    """
+    Get the name of the file that keeps the BDD variable order of a board after dynamic reordering.
+    The name depends only on the non wall cells, so boards with the same layout share their saved order.
+    :param board: the board of the current Sokoban game
+    :return: the name of the order file
+    """
+    layout = '\n'.join(''.join('#' if cell == '#' else '-' for cell in row) for row in board)
+    return f"order_{len(board)}x{len(board[0])}_{hashlib.sha1(layout.encode()).hexdigest()[:12]}.ord"
+
+def gen_order_file(board_file='board10.txt', order_file_name='sokoban_model.ord', dynamic_reordering=False):
+    """
+    Get the BDD variable order file for the given Sokoban board.
+    An order saved by an earlier run of a board with the same non wall cells is used first,
+    and otherwise an order is generated from the geometry of the board.
+    :param board_file: the file containing the Sokoban board
+    :param order_file_name: the name of the order file to generate
+    :param dynamic_reordering: if True, nuXmv reorders the variables during the run and saves the final order
+    :return: the name of the order file to use, and the name of the file to save the reordered order in
+             (None without dynamic reordering)
+    """
+    # read board from file
+    board = read_from_file(board_file)
+    save_file_name = saved_order_name(board)
+
+    # save the current path
+    current_path = os.getcwd()
+
+    #### CHANGE THE PATH TO THE PATH OF YOUR nuXmv BIN FOLDER ####
+    model_file_path = r'C:\Users\shoham\Documents\ENG_degree\Final Project\nuXmv-2.0.0-win64\bin'
+    # ^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+    os.chdir(model_file_path)
+
+    if os.path.exists(save_file_name):
+        order_file_name = save_file_name
+    else:
+        with open(order_file_name, 'w') as file:
+            file.write('\n'.join(define_variable_order(board)) + '\n')
+
+    # change the directory back to the original directory
+    os.chdir(current_path)
+
+    return order_file_name, save_file_name if dynamic_reordering else None
+
 # ^^^^^^^^^^^^^^^^^^^^^^^^^^^^ MAIN FUNCTION OF SCRIPT ^^^^^^^^^^^^^^^^^^^^^^^^^^^^
 ##### CHANGE HERE TO THE FULL BOARD PATH #####
-def gen_board(board_file= 'board10.txt'):
+def gen_board(board_file= 'board10.txt', model_file_name='sokoban_model.smv', compress_tunnels=False):
     """
     Generate the SMV model file for the given Sokoban board.
     :param board_file: the file containing the Sokoban board
+    :param model_file_name: the name of the SMV model file to generate
+    :param compress_tunnels: if True, walking through an empty tunnel is a single step (see find_tunnels)
     :return: the name of the generated SMV model file
     """
     # read board from file
     board = read_from_file(board_file)
 
     # create SMV model and win conditions
-    smv_model = create_smv_model(board)
-
-    # save the SMV model to a file with a meaningful name
-    model_file_name = 'sokoban_model.smv'
+    smv_model = create_smv_model(board, compress_tunnels=compress_tunnels)
 
     # save the current path
     current_path = os.getcwd()
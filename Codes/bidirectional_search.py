@@ -0,0 +1,145 @@
+from Model_Smv import *
+import time
+import run_nuXmv
+import re
+from trace_archive import CELL_TO_XSB, parse_nuxmv_output
+
+# the forward LURD move of each move of the reverse game
+OPPOSITE_MOVES = {'l': 'r', 'r': 'l', 'u': 'd', 'd': 'u'}
+
+
+def save_model(model_file_name, smv_model):
+    """
+    Save an SMV model in the nuXmv bin folder.
+    :param model_file_name: the name of the SMV model file
+    :param smv_model: the SMV model as a string
+    """
+    # get the current path
+    curr_path = os.getcwd()
+
+    #### CHANGE HERE TO THE PATH OF YOUR nuXmv BIN FOLDER ####
+    os.chdir(r'C:\Users\shoham\Documents\ENG_degree\Final Project\nuXmv-2.0.0-win64\bin')
+    # ^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+
+    write_to_file(model_file_name, smv_model)
+
+    # return the path to the previous path
+    os.chdir(curr_path)
+
+
+def read_output(output_file_name):
+    """
+    Read an output file of nuXmv from the nuXmv bin folder.
+    :param output_file_name: the name of the output file
+    :return: the output of nuXmv
+    """
+    # get the current path
+    curr_path = os.getcwd()
+
+    #### CHANGE HERE TO THE PATH OF YOUR nuXmv BIN FOLDER ####
+    os.chdir(r'C:\Users\shoham\Documents\ENG_degree\Final Project\nuXmv-2.0.0-win64\bin')
+    # ^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+
+    with open(output_file_name, "r") as f:
+        output = f.read()
+
+    # return the path to the previous path
+    os.chdir(curr_path)
+
+    return output
+
+
+def extract_reachable_states(output, board):
+    """
+    Extract the reachable states printed by print_reachable_states -v.
+    :param output: the output of nuXmv
+    :param board: the board of the current Sokoban game (used for the walls and the size)
+    :return: a set of the reachable boards, each board is a tuple of rows strings
+    """
+    states = set()
+    current = None
+
+    for line in output.split('\n'):
+        # each state starts with a "------- State    N ------" line
+        if 'State' in line:
+            if current is not None:
+                states.add(tuple(''.join(row) for row in current))
+            current = [list(row) for row in board]
+        elif current is not None and 'game_board' in line:
+            cell = re.findall(r'\[([0-9]+)\]\[([0-9]+)\] = (\w+)', line)
+            if cell:
+                row, col, value = cell[0]
+                current[int(row)][int(col)] = CELL_TO_XSB[value]
+
+    if current is not None:
+        states.add(tuple(''.join(row) for row in current))
+
+    return states
+
+
+def trace_moves(output):
+    """
+    Extract the moves of a BMC trace, leaving out the steps where the board didn't change.
+    :param output: the output of nuXmv
+    :return: list of player movements (LURD format)
+    """
+    trace = parse_nuxmv_output(output, "SAT")
+
+    # steps[i + 1] holds the cells changed by moves[i]
+    return [move for move, step in zip(trace['moves'], trace['steps'][1:]) if step]
+
+
+def solve_bidirectional(board_to_read, k):
+    """
+    Solve the board by searching forward from the initial board and backward from the goals at the same time.
+    Each direction searches about half of the bound, and a solution is found when the two meet.
+    :param board_to_read: the board file to read
+    :param k: the bound of the whole solution
+    :return: list of player movements (LURD format), empty if there is no solution within k moves
+    """
+    name_of_board = board_to_read.split(".")[0]
+    board = read_from_file(board_to_read)
+
+    k = int(k)
+    k_forward = (k + 1) // 2
+    k_backward = k // 2
+
+    # compute the states reachable in each direction at the same time
+    save_model(f"{name_of_board}_forward.smv", create_smv_model(board))
+    save_model(f"{name_of_board}_backward.smv", create_reverse_smv_model(board))
+
+    start_time = time.time()  # Record start time
+    forward_output, backward_output = run_nuXmv.run_nuxmv_concurrently(
+        [(f"{name_of_board}_forward.smv", k_forward, "REACHABLE"),
+         (f"{name_of_board}_backward.smv", k_backward, "REACHABLE")])
+
+    forward_states = extract_reachable_states(read_output(forward_output), board)
+    backward_states = extract_reachable_states(read_output(backward_output), board)
+
+    # the states where the two searches meet
+    meeting_states = sorted(forward_states & backward_states)
+    if not meeting_states:
+        print(f"Frontiers don't meet - there is no solution with k = {k}")
+        return []
+
+    meeting_board = [list(row) for row in meeting_states[0]]
+    meeting_condition = define_state_condition(meeting_board)
+
+    # find the path from the initial board to the meeting state, and from the goals back to the meeting state
+    save_model(f"{name_of_board}_forward.smv", create_smv_model(board, meeting_condition))
+    save_model(f"{name_of_board}_backward.smv", create_reverse_smv_model(board, meeting_condition))
+
+    forward_output, backward_output = run_nuXmv.run_nuxmv_concurrently(
+        [(f"{name_of_board}_forward.smv", k_forward, "SAT"),
+         (f"{name_of_board}_backward.smv", k_backward, "SAT")])
+    end_time = time.time()  # Record end time
+
+    forward_moves = trace_moves(read_output(forward_output))
+    backward_moves = trace_moves(read_output(backward_output))
+
+    # the reverse game goes from the goals to the meeting state, so its moves are played backwards
+    player_movements = forward_moves + [OPPOSITE_MOVES[move] for move in reversed(backward_moves)]
+
+    print(f"Total run time: {end_time - start_time:.3f} seconds")
+
+    return player_movements
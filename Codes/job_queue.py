@@ -0,0 +1,336 @@
+import os
+import re
+import json
+import time
+import socket
+import sqlite3
+import threading
+import multiprocessing
+import run_nuXmv
+from Model_Smv import gen_board, read_from_file
+from lower_bound import lower_bound
+from LURD_moves import automation_LURD_moves
+from trace_archive import archive_run
+
+#### CHANGE HERE TO THE PATH OF YOUR nuXmv BIN FOLDER ####
+NUXMV_BIN_PATH = r'C:\Users\shoham\Documents\ENG_degree\Final Project\nuXmv-2.0.0-win64\bin'
+# ^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+
+# a running job whose worker stopped refreshing it for this long (e.g. the machine rebooted) is claimed again
+LEASE_SECONDS = 5 * 60
+
+# how often a worker refreshes the claim of the job it's running
+HEARTBEAT_SECONDS = 30
+
+# the delay before the first retry of a failed job, doubled after each failed attempt
+BACKOFF_SECONDS = 30
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    board TEXT NOT NULL,
+    engine TEXT NOT NULL,
+    k_policy TEXT,
+    status TEXT NOT NULL DEFAULT 'pending',  -- pending, running, done, failed
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 3,
+    next_run_at REAL NOT NULL DEFAULT 0,
+    worker TEXT,
+    claimed_at REAL,
+    result TEXT,                             -- JSON: solved, k, moves
+    error TEXT,
+    run_time REAL,                           -- seconds of nuXmv runs of the last attempt
+    created_at REAL NOT NULL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, next_run_at);
+"""
+
+
+def connect(db_path):
+    """
+    Open the job database and create the jobs table if needed.
+    :param db_path: the path of the SQLite database
+    :return: the connection to the database
+    """
+    # autocommit mode, the transactions are opened explicitly
+    connection = sqlite3.connect(db_path, timeout=60, isolation_level=None)
+    connection.row_factory = sqlite3.Row
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def k_values(k_policy):
+    """
+    Get the bounds to try for a k policy.
+    The policy is either a single bound ("20") or a growing bound "start:step:max" ("10:10:40" tries 10, 20, 30, 40).
+    :param k_policy: the k policy of the job
+    :return: list of the bounds to try, [None] if there is no bound (BDD engine)
+    """
+    if k_policy is None:
+        return [None]
+
+    parts = [int(part) for part in str(k_policy).split(':')]
+    if len(parts) == 1:
+        return parts
+    elif len(parts) == 3:
+        start, step, maximum = parts
+        return list(range(start, maximum + 1, step))
+    else:
+        raise ValueError(f"Invalid k policy {k_policy}")
+
+
+def add_job(db_path, board, engine="SAT", k_policy=None, max_attempts=3):
+    """
+    Add a board to the job queue.
+    :param db_path: the path of the SQLite database
+    :param board: the board file to solve
+    :param engine: "SAT" or "BDD"
+    :param k_policy: the bounds to try for the SAT engine (see k_values)
+    :param max_attempts: the number of times the job is tried before it's marked as failed
+    :return: the id of the new job
+    """
+    # check the policy now instead of failing in the worker
+    k_values(k_policy)
+
+    connection = connect(db_path)
+    cursor = connection.execute(
+        "INSERT INTO jobs (board, engine, k_policy, max_attempts, created_at) VALUES (?, ?, ?, ?, ?)",
+        (board, engine, None if k_policy is None else str(k_policy), max_attempts, time.time()))
+    connection.close()
+
+    return cursor.lastrowid
+
+
+def claim_job(connection, worker):
+    """
+    Atomically claim the next job that is ready to run.
+    Jobs left running by a worker that crashed are claimed again once their lease expires.
+    :param connection: the connection to the database
+    :param worker: the name of the worker
+    :return: the claimed job (sqlite3.Row) or None if there is no job to run
+    """
+    now = time.time()
+
+    # BEGIN IMMEDIATE takes the write lock, so two workers can't claim the same job
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        job = connection.execute(
+            "SELECT * FROM jobs WHERE (status = 'pending' AND next_run_at <= ?) "
+            "OR (status = 'running' AND claimed_at < ?) ORDER BY id LIMIT 1",
+            (now, now - LEASE_SECONDS)).fetchone()
+
+        if job is not None:
+            connection.execute(
+                "UPDATE jobs SET status = 'running', worker = ?, claimed_at = ?, attempts = attempts + 1 "
+                "WHERE id = ?", (worker, now, job['id']))
+            job = connection.execute("SELECT * FROM jobs WHERE id = ?", (job['id'],)).fetchone()
+
+        connection.execute("COMMIT")
+    except Exception:
+        connection.execute("ROLLBACK")
+        raise
+
+    return job
+
+
+def solve_job(job, archive_path=None):
+    """
+    Solve the board of a job with nuXmv, trying the bounds of its k policy in order.
+    :param job: the job (sqlite3.Row)
+    :param archive_path: the trace archive to save the last run and the running times in, None to skip it
+    :return: the result of the job and the running time of nuXmv
+    """
+    # boards that the lower bound shows can't be solved are answered without running nuXmv
+    min_k = lower_bound(read_from_file(job['board']))
+    if min_k is None:
+        return {'solved': False, 'k': None, 'moves': []}, 0
+
+    # each job gets its own model file so workers don't override each other
+    board_file_name = gen_board(job['board'], f"sokoban_model_job{job['id']}.smv")
+
+    timings = []
+    output = None
+    player_movements = []
+    k = None
+
+    for k in k_values(job['k_policy']):
+        # bounds below the lower bound can't have a path to win
+        if k is not None and k < min_k:
+            continue
+
+        start_time = time.time()
+        output_file_name = run_nuXmv.run_nuxmv(board_file_name, k, job['engine'], min_k=min_k)
+        timings.append(time.time() - start_time)
+
+        # a finished run either prints the result of the specification or checks all the bounds up to k,
+        # nuXmv that stopped in the middle (crash, error) is retried instead of skipping the bounds it missed
+        with open(os.path.join(NUXMV_BIN_PATH, output_file_name), 'r') as f:
+            output = f.read()
+            bounds = [int(bound) for bound in re.findall(r'no counterexample found with bound (\d+)', output)]
+            if '-- specification' not in output and (k is None or not bounds or max(bounds) != k):
+                raise RuntimeError(f"nuXmv didn't check the specification (k = {k})")
+
+        # the bounds up to k were already checked
+        if k is not None:
+            min_k = k + 1
+
+        player_movements = automation_LURD_moves(output_file_name)
+
+        # stop at the first bound with a path to win
+        if len(player_movements) != 0:
+            break
+
+    result = {'solved': len(player_movements) != 0, 'k': k, 'moves': player_movements}
+
+    if archive_path is not None and output is not None:
+        archive_run(archive_path, output, read_from_file(job['board']), job['engine'], timings, player_movements)
+
+    return result, sum(timings)
+
+
+def keep_claim(db_path, job, stop):
+    """
+    Refresh the claim of a running job until stop is set, so other workers don't claim it again.
+    :param db_path: the path of the SQLite database
+    :param job: the job (sqlite3.Row)
+    :param stop: threading.Event that is set when the job is finished
+    """
+    # the thread needs its own connection
+    connection = connect(db_path)
+    while not stop.wait(HEARTBEAT_SECONDS):
+        connection.execute("UPDATE jobs SET claimed_at = ? WHERE id = ? AND worker = ? AND status = 'running'",
+                           (time.time(), job['id'], job['worker']))
+    connection.close()
+
+
+def finish_job(connection, job, result, run_time):
+    """
+    Save the result of a job that was solved.
+    :param connection: the connection to the database
+    :param job: the job (sqlite3.Row)
+    :param result: the result of the job
+    :param run_time: the running time of nuXmv
+    """
+    connection.execute(
+        "UPDATE jobs SET status = 'done', result = ?, run_time = ?, error = NULL, finished_at = ? "
+        "WHERE id = ? AND worker = ?",
+        (json.dumps(result), run_time, time.time(), job['id'], job['worker']))
+
+
+def fail_job(connection, job, error):
+    """
+    Record a failed attempt of a job, the job is retried with backoff until it runs out of attempts.
+    :param connection: the connection to the database
+    :param job: the job (sqlite3.Row)
+    :param error: the error of the attempt
+    """
+    if job['attempts'] < job['max_attempts']:
+        delay = BACKOFF_SECONDS * 2 ** (job['attempts'] - 1)
+        connection.execute(
+            "UPDATE jobs SET status = 'pending', error = ?, next_run_at = ? WHERE id = ? AND worker = ?",
+            (str(error), time.time() + delay, job['id'], job['worker']))
+    else:
+        connection.execute(
+            "UPDATE jobs SET status = 'failed', error = ?, finished_at = ? WHERE id = ? AND worker = ?",
+            (str(error), time.time(), job['id'], job['worker']))
+
+
+def run_worker(db_path, worker=None, wait_for_jobs=False, archive_path=None):
+    """
+    Claim and solve jobs until the queue is empty.
+    :param db_path: the path of the SQLite database
+    :param worker: the name of the worker, defaults to host:pid
+    :param wait_for_jobs: if True, keep waiting for new jobs instead of returning when the queue is empty
+    :param archive_path: the trace archive to save the results in, None to skip it
+    :return: the number of jobs this worker handled
+    """
+    if worker is None:
+        worker = f"{socket.gethostname()}:{os.getpid()}"
+
+    # solve_job changes the working directory to the nuXmv bin folder while the heartbeat thread connects
+    db_path = os.path.abspath(db_path)
+
+    connection = connect(db_path)
+    handled = 0
+
+    while True:
+        job = claim_job(connection, worker)
+
+        if job is None:
+            # jobs waiting for a retry or running in other workers may still come back
+            pending = connection.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status IN ('pending', 'running')").fetchone()[0]
+            if pending == 0 and not wait_for_jobs:
+                break
+            time.sleep(5)
+            continue
+
+        print(f"{worker}: solving job {job['id']} ({job['board']}, attempt {job['attempts']})")
+        # refresh the claim while nuXmv runs, a job of a worker that died is claimed again after LEASE_SECONDS
+        stop = threading.Event()
+        heartbeat = threading.Thread(target=keep_claim, args=(db_path, job, stop), daemon=True)
+        heartbeat.start()
+        try:
+            result, run_time = solve_job(job, archive_path)
+        except Exception as e:
+            print(f"{worker}: job {job['id']} failed: {e}")
+            fail_job(connection, job, e)
+        else:
+            finish_job(connection, job, result, run_time)
+        finally:
+            stop.set()
+            heartbeat.join()
+        handled += 1
+
+    connection.close()
+
+    return handled
+
+
+def job_results(db_path, status=None):
+    """
+    Get the jobs and their results.
+    :param db_path: the path of the SQLite database
+    :param status: return only the jobs with this status, None for all of them
+    :return: list of jobs as dictionaries, the result is decoded from JSON
+    """
+    connection = connect(db_path)
+    if status is None:
+        rows = connection.execute("SELECT * FROM jobs ORDER BY id").fetchall()
+    else:
+        rows = connection.execute("SELECT * FROM jobs WHERE status = ? ORDER BY id", (status,)).fetchall()
+    connection.close()
+
+    jobs = []
+    for row in rows:
+        job = dict(row)
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        jobs.append(job)
+
+    return jobs
+
+
+if __name__ == '__main__':
+    #### CHANGE HERE TO THE DATABASE, THE BOARDS TO ADD AND THE NUMBER OF WORKERS ####
+    database = 'sokoban_jobs.db'
+    boards = []  # e.g. ['board1.txt', 'board7.txt']
+    engine = "SAT"
+    k_policy = "10:10:40"
+    num_workers = 2
+    archive_file = 'sokoban_traces.arc'  # None to keep only the .out files
+    # ^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+
+    for board in boards:
+        add_job(database, board, engine, k_policy if engine == "SAT" else None)
+
+    # the workers continue the jobs left in the database by previous runs
+    workers = [multiprocessing.Process(target=run_worker, args=(database, None, False, archive_file)) for _ in range(num_workers)]
+    for process in workers:
+        process.start()
+    for process in workers:
+        process.join()
+
+    for job in job_results(database):
+        print(f"Job {job['id']} ({job['board']}, {job['engine']}): {job['status']}, result: {job['result']}")
@@ -0,0 +1,132 @@
+from collections import deque
+from Model_Smv import is_floor
+
+# the row and column change of each LURD move
+DIRECTIONS = {'l': (0, -1), 'r': (0, 1), 'u': (-1, 0), 'd': (1, 0)}
+
+INFINITY = float('inf')
+
+
+def find_cells(board, symbols):
+    """
+    Find the cells of the board holding one of the given symbols.
+    :param board: the board of the current Sokoban game
+    :param symbols: the XSB symbols to look for
+    :return: list of (row, col) of the cells
+    """
+    return [(i, j) for i in range(len(board)) for j in range(len(board[i])) if board[i][j] in symbols]
+
+
+def push_distances(board, goal):
+    """
+    Compute the minimal number of pushes needed to bring a box from each cell to a goal.
+    The other boxes are ignored, so the distances never overestimate.
+    :param board: the board of the current Sokoban game
+    :param goal: the (row, col) of the goal
+    :return: dictionary of cell -> number of pushes, cells that can't reach the goal are missing
+    """
+    distances = {goal: 0}
+    queue = deque([goal])
+
+    # search backwards: a box reaches cell x from cell y = x - d if the player can stand at y - d
+    while queue:
+        i, j = queue.popleft()
+        for di, dj in DIRECTIONS.values():
+            box = (i - di, j - dj)
+            player = (i - 2 * di, j - 2 * dj)
+            if box not in distances and is_floor(board, *box) and is_floor(board, *player):
+                distances[box] = distances[(i, j)] + 1
+                queue.append(box)
+
+    return distances
+
+
+def walking_distances(board, start):
+    """
+    Compute the number of moves the player needs to walk from its cell to every cell without pushing a box.
+    :param board: the board of the current Sokoban game
+    :param start: the (row, col) of the player
+    :return: dictionary of cell -> number of moves, cells that the player can't reach are missing
+    """
+    distances = {start: 0}
+    queue = deque([start])
+
+    while queue:
+        i, j = queue.popleft()
+        for di, dj in DIRECTIONS.values():
+            cell = (i + di, j + dj)
+            if cell not in distances and is_floor(board, *cell) and board[cell[0]][cell[1]] not in ['$', '*']:
+                distances[cell] = distances[(i, j)] + 1
+                queue.append(cell)
+
+    return distances
+
+
+def min_cost_assignment(costs):
+    """
+    Find the minimal total cost of filling each goal with a different box.
+    The board is won when all the goals are filled, so boxes left over stay where they are.
+    Boards have only a few boxes, so a dynamic programming over the subsets of used boxes is enough.
+    :param costs: costs[g][b] is the cost of bringing box b to goal g (INFINITY if it can't)
+    :return: the minimal total cost, INFINITY if there is no assignment
+    """
+    if not costs:
+        return 0
+
+    num_boxes = len(costs[0])
+
+    # best[mask] is the minimal cost of filling the first goals with the boxes in mask
+    best = {0: 0}
+    for goal_costs in costs:
+        next_best = {}
+        for mask, cost in best.items():
+            for box in range(num_boxes):
+                if mask & (1 << box) or goal_costs[box] == INFINITY:
+                    continue
+                new_mask = mask | (1 << box)
+                new_cost = cost + goal_costs[box]
+                if new_cost < next_best.get(new_mask, INFINITY):
+                    next_best[new_mask] = new_cost
+        best = next_best
+
+    return min(best.values()) if best else INFINITY
+
+
+def lower_bound(board):
+    """
+    Compute a lower bound on the number of moves needed to solve the board.
+    Every push is a move, each goal needs at least the push distance of the box that ends on it,
+    and the player has to walk to the cell behind a box before the first push.
+    :param board: the board of the current Sokoban game (as returned from read_from_file)
+    :return: the lower bound, or None if the board can't be solved (the goals can't all get a different box)
+    """
+    boxes = find_cells(board, ['$', '*'])
+    goals = find_cells(board, ['.', '+', '*'])
+    players = find_cells(board, ['@', '+'])
+
+    if len(players) != 1:
+        return None
+
+    # the push distance of every box to every goal
+    goal_distances = [push_distances(board, goal) for goal in goals]
+    costs = [[distances.get(box, INFINITY) for box in boxes] for distances in goal_distances]
+
+    pushes = min_cost_assignment(costs)
+    if pushes == INFINITY:
+        return None
+    if pushes == 0:
+        return 0
+
+    # the player walks to the cell behind one of the boxes before the first push
+    walk = walking_distances(board, players[0])
+    first_push = INFINITY
+    for i, j in boxes:
+        for di, dj in DIRECTIONS.values():
+            player_cell = (i - di, j - dj)
+            if is_floor(board, i + di, j + dj) and board[i + di][j + dj] not in ['$', '*'] and player_cell in walk:
+                first_push = min(first_push, walk[player_cell])
+
+    if first_push == INFINITY:
+        return None
+
+    return pushes + first_push
@@ -1,57 +1,203 @@
 import os
 import subprocess
 import time
+from concurrent.futures import ThreadPoolExecutor
 
-def run_nuxmv(model_filename, k=None, engine=None):
+def nuxmv_commands(model_filename, k=None, engine=None, properties=None, order_file=None, save_order_file=None):
     """
-    Run nuXmv model checker with the given model file and parameters.
+    Build the nuXmv command line and the commands to write to its stdin.
 
     :param model_filename (str): The filename of the nuXmv model.
     :param k (int, optional): The number of steps for bounded model checking. Defaults to None.
-    :param engine (str, optional): The engine to use for model checking.
-                                Options: "SAT" for SAT-based BMC, "BDD" for BDD-based BMC. Defaults to None.
-    :return: The filename of the output file.
+    :param engine (str, optional): The engine to use for model checking ("SAT" or "BDD"), or "REACHABLE" to print
+                                the states reachable in k steps with the BDD engine. Defaults to None.
+    :param properties (list, optional): Names of the LTL properties to check one after the other in the
+                                same session. Defaults to None (check all the properties at once).
+    :param order_file (str, optional): BDD variable order file to read (see gen_order_file). Defaults to None.
+    :param save_order_file (str, optional): File to write the BDD variable order to after the check, with
+                                dynamic reordering enabled. Defaults to None.
+    :return: The arguments of the process and the text to write to its stdin.
     """
 
-    # get current directory
-    cwd = os.getcwd()
-
-    #### CHANGE HERE TO THE PATH OF YOUR nuXmv BIN FOLDER ####
-    os.chdir(r'C:\Users\shoham\Documents\ENG_degree\Final Project\nuXmv-2.0.0-win64\bin')
-    # ^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
-
     if engine == "SAT":
         # run the command
         args = [".\\nuXmv.exe", "-int", model_filename]
-        nuxmv_process = subprocess.Popen(args, stdin=subprocess.PIPE, stdout= subprocess.PIPE, universal_newlines=True)
         # next command to run
-        nuxmv_process.stdin.write("go_bmc\n")
-        nuxmv_process.stdin.write(f"check_ltlspec_bmc -k {k}\n")
+        commands = "go_bmc\n"
+        if properties is None:
+            commands += f"check_ltlspec_bmc -k {k}\n"
+        else:
+            # the model is flattened and encoded once for all the properties
+            for property_name in properties:
+                commands += f"check_ltlspec_bmc -k {k} -P {property_name}\n"
 
         # enter cnrl + c to exit
-        nuxmv_process.stdin.write("quit\n")
+        commands += "quit\n"
+
+    elif engine == "BDD" and (order_file is not None or save_order_file is not None):
+        # run the command with the variable order of the board
+        args = [".\\nuXmv.exe", "-int"]
+        if order_file is not None:
+            args += ["-i", order_file]
+        if save_order_file is not None:
+            args += ["-dynamic"]
+        args += [model_filename]
+        # next command to run
+        commands = "go\n"
+        if properties is None:
+            commands += f"check_ltlspec\n"
+        else:
+            for property_name in properties:
+                commands += f"check_ltlspec -P {property_name}\n"
+
+        # keep the order found by dynamic reordering for the next runs
+        if save_order_file is not None:
+            commands += f"write_order -o {save_order_file}\n"
+
+        # enter cnrl + c to exit
+        commands += "quit\n"
 
     elif engine == "BDD":
         # run the command
-        args = [".\\nuXmv.exe", "-int", model_filename]
-        nuxmv_process = subprocess.Popen([".\\nuXmv", ".\\" + model_filename], stdin=subprocess.PIPE,
-                                         stdout=subprocess.PIPE, universal_newlines=True)
+        args = [".\\nuXmv", ".\\" + model_filename]
         # next command to run
-        nuxmv_process.stdin.write("go\n")
-        nuxmv_process.stdin.write(f"check_ltlspec\n")
+        commands = "go\n"
+        if properties is None:
+            commands += f"check_ltlspec\n"
+        else:
+            for property_name in properties:
+                commands += f"check_ltlspec -P {property_name}\n"
 
         # enter cnrl + c to exit
-        nuxmv_process.stdin.write("quit\n")
+        commands += "quit\n"
+
+    elif engine == "REACHABLE":
+        # run the command
+        args = [".\\nuXmv.exe", "-int", model_filename]
+        # compute the states reachable in k steps and print all of them
+        commands = "go\n"
+        commands += f"compute_reachable -k {k}\n"
+        commands += "print_reachable_states -v\n"
+
+        # enter cnrl + c to exit
+        commands += "quit\n"
 
     else:
         # run the command
-        nuxmv_process = subprocess.Popen([".\\nuXmv.exe", model_filename], stdin=subprocess.PIPE,
-                                        stdout=subprocess.PIPE, universal_newlines=True)
+        args = [".\\nuXmv.exe", model_filename]
+        commands = ""
+
+    return args, commands
+
+# the prompt nuXmv prints (without a new line) when it waits for the next command
+NUXMV_PROMPT = "nuXmv > "
+
+
+def read_until_prompt(nuxmv_process):
+    """
+    Read the output of an interactive nuXmv process until it prints its prompt or exits.
+
+    :param nuxmv_process: The nuXmv process.
+    :return: The output read and True if nuXmv exited.
+    """
+    output = ""
+    # the prompt doesn't end with a new line, so read one character at a time
+    while not output.endswith(NUXMV_PROMPT):
+        char = nuxmv_process.stdout.read(1)
+        if not char:
+            return output, True
+        output += char
+
+    return output, False
+
+
+def run_bmc_from_bound(args, min_k, k):
+    """
+    Run BMC on the bounds min_k..k only, checking each bound with check_ltlspec_bmc_onepb.
+    The bounds are sent one at a time so nuXmv stops at the first bound with a counterexample.
+    Each command is answered when nuXmv prints its prompt again, so an error (e.g. in the model)
+    stops the run instead of waiting for a result that never comes.
+
+    :param args (list): The arguments of the nuXmv process.
+    :param min_k (int): The first bound to check.
+    :param k (int): The last bound to check.
+    :return: The output of nuXmv.
+    """
+    # the errors go to the same stream, so they end up in the output file
+    nuxmv_process = subprocess.Popen(args, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                     universal_newlines=True)
+
+    # wait for nuXmv to start
+    output, exited = read_until_prompt(nuxmv_process)
+
+    if not exited:
+        nuxmv_process.stdin.write("go_bmc\n")
+        nuxmv_process.stdin.flush()
+        chunk, exited = read_until_prompt(nuxmv_process)
+        output += chunk
+
+    bound = int(min_k)
+    while not exited and bound <= int(k):
+        nuxmv_process.stdin.write(f"check_ltlspec_bmc_onepb -k {bound}\n")
+        nuxmv_process.stdin.flush()
+        chunk, exited = read_until_prompt(nuxmv_process)
+        output += chunk
+
+        # go on to the next bound only if this one was checked without a counterexample,
+        # stop on a counterexample or on anything else (an error)
+        if "no counterexample found with bound" not in chunk:
+            break
+        bound += 1
+
+    if not exited:
+        # enter cnrl + c to exit
+        nuxmv_process.stdin.write("quit\n")
+        nuxmv_process.stdin.close()
+
+        # read the rest of the output from the same buffered stream
+        output += nuxmv_process.stdout.read()
+    nuxmv_process.wait()
+
+    return output
+
+def run_nuxmv(model_filename, k=None, engine=None, properties=None, min_k=None, order_file=None,
+              save_order_file=None):
+    """
+    Run nuXmv model checker with the given model file and parameters.
+
+    :param model_filename (str): The filename of the nuXmv model.
+    :param k (int, optional): The number of steps for bounded model checking. Defaults to None.
+    :param engine (str, optional): The engine to use for model checking.
+                                Options: "SAT" for SAT-based BMC, "BDD" for BDD-based BMC. Defaults to None.
+    :param properties (list, optional): Names of the LTL properties to check one after the other in the
+                                same session. Defaults to None (check all the properties at once).
+    :param order_file (str, optional): BDD variable order file to read (see gen_order_file). Defaults to None.
+    :param save_order_file (str, optional): File to write the BDD variable order to after the check, with
+                                dynamic reordering enabled. Defaults to None.
+    :param min_k (int, optional): A lower bound on the solution length (see lower_bound.py), the SAT engine
+                                skips the bounds below it. Defaults to None (start from bound 0).
+    :return: The filename of the output file.
+    """
+
+    # get current directory
+    cwd = os.getcwd()
+
+    #### CHANGE HERE TO THE PATH OF YOUR nuXmv BIN FOLDER ####
+    os.chdir(r'C:\Users\shoham\Documents\ENG_degree\Final Project\nuXmv-2.0.0-win64\bin')
+    # ^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+
+    # build the command line and the interactive commands of the run
+    args, commands = nuxmv_commands(model_filename, k, engine, properties, order_file, save_order_file)
 
     # generate output file name
     output_filename = model_filename.split(".")[0] + ".out"
 
-    stdout, _ = nuxmv_process.communicate()
+    if engine == "SAT" and min_k is not None and properties is None:
+        stdout = run_bmc_from_bound(args, min_k, k)
+    else:
+        nuxmv_process = subprocess.Popen(args, stdin=subprocess.PIPE, stdout=subprocess.PIPE, universal_newlines=True)
+        nuxmv_process.stdin.write(commands)
+        stdout, _ = nuxmv_process.communicate()
 
     # save output to file
     with open(output_filename, "w") as f:
@@ -61,4 +207,46 @@ def run_nuxmv(model_filename, k=None, engine=None):
     # change the directory back to the original directory
     os.chdir(cwd)
 
-    return output_filename
\ No newline at end of file
+    return output_filename
+
+def run_nuxmv_concurrently(runs):
+    """
+    Run several nuXmv processes at the same time.
+
+    :param runs (list): (model_filename, k, engine) of each run, see run_nuxmv.
+    :return: The filenames of the output files, in the order of the runs.
+    """
+
+    # get current directory
+    cwd = os.getcwd()
+
+    #### CHANGE HERE TO THE PATH OF YOUR nuXmv BIN FOLDER ####
+    os.chdir(r'C:\Users\shoham\Documents\ENG_degree\Final Project\nuXmv-2.0.0-win64\bin')
+    # ^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+
+    # start all the processes before waiting for any of them
+    processes = []
+    for model_filename, k, engine in runs:
+        args, commands = nuxmv_commands(model_filename, k, engine)
+        nuxmv_process = subprocess.Popen(args, stdin=subprocess.PIPE, stdout=subprocess.PIPE, universal_newlines=True)
+        processes.append((nuxmv_process, commands))
+
+    # read the outputs in threads so a full pipe of one process doesn't block the others
+    with ThreadPoolExecutor(max_workers=len(processes)) as executor:
+        stdouts = list(executor.map(lambda process: process[0].communicate(process[1])[0], processes))
+
+    output_filenames = []
+    for (model_filename, _, _), stdout in zip(runs, stdouts):
+        # generate output file name
+        output_filename = model_filename.split(".")[0] + ".out"
+
+        # save output to file
+        with open(output_filename, "w") as f:
+            f.write(stdout)
+        print(f"Output saved to {output_filename}")
+        output_filenames.append(output_filename)
+
+    # change the directory back to the original directory
+    os.chdir(cwd)
+
+    return output_filenames
@@ -2,6 +2,12 @@ from Model_Smv import *
 import time
 import run_nuXmv
 import re
+from trace_archive import parse_nuxmv_output
+
+# an iteration that took less than this part of the time budget (and of the bound) adds more goals next time
+FAST_ITERATION = 0.25
+# an iteration that took more than this part of the time budget goes back to a single goal
+SLOW_ITERATION = 0.75
 
 def extract_lines_between_states(output):
     """
@@ -195,13 +201,167 @@ def define_solvability_iterative(board, goals_of_iteration):
 
     return is_solvable
 
-def solve_board_iteratively(board_to_read):
+def write_iteration_model(name_of_board, goals_of_iteration, board):
+    """
+    Generate the SMV model of an iteration and save it in the nuXmv bin folder.
+    :param name_of_board: the name of the board (used in the model file name)
+    :param goals_of_iteration: a list of winning conditions
+    :param board: the board of the current Sokoban game
+    :return: the name of the model file
+    """
+    smv_model = gen_board_one_goal(goals_of_iteration, board)
+
+    # get the current path
+    curr_path = os.getcwd()
+
+    #### CHANGE HERE TO THE PATH OF YOUR nuXmv BIN FOLDER ####
+    os.chdir(r'C:\Users\shoham\Documents\ENG_degree\Final Project\nuXmv-2.0.0-win64\bin')
+    # ^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+
+    with open(f"{name_of_board}_goals{goals_of_iteration}.smv", 'w') as f:
+        f.write(smv_model)
+
+    # return the path to the previous path
+    os.chdir(curr_path)
+
+    return f"{name_of_board}_goals{goals_of_iteration}.smv"
+
+def gen_board_goal_subsets(goal_subsets, board):
+    """
+    Create one SMV model with a solvability definition and a named property for each goal subset.
+    :param goal_subsets: a list of lists of goals (winning conditions)
+    :param board: the board of the current Sokoban game
+    :return: the SMV model and the names of its properties
+    """
+
+    n = len(board)
+    m = len(board[0])
+
+    # one is_solvable_i definition and one goals_i property for each subset
+    defines = ''
+    specs = ''
+    property_names = []
+    for i, goals_of_subset in enumerate(goal_subsets):
+        defines += f'is_solvable_{i} :=\n            {define_solvability_iterative(board, goals_of_subset)}\n        '
+        specs += f'LTLSPEC NAME goals_{i} := !(F is_solvable_{i});\n    '
+        property_names.append(f'goals_{i}')
+
+    smv_model = f"""
+    MODULE main
+
+    -- Define the puzzle state variables
+    VAR
+        game_board: array 0..{n - 1} of array 0..{m - 1} of {{Wall, Player, PonGoal, Box, BonGoal, Goal, Floor}};
+        movement: {{r, l, u, d}}; --direction is non-determinisic
+
+    -- Define the initial state
+    INIT
+        {define_initial_states(board, n, m)}
+
+    -- Define transition rules for moving tiles
+    ASSIGN
+        {define_transitions(board)}
+
+    -- Define a function for each goal subset to check solvability based on the condition that its goals . convert to *
+    DEFINE
+        {defines}
+
+    -- Specify properties to check solvability of each goal subset
+    {specs}
+    """
+    return smv_model, property_names
+
+def extract_property_results(output, property_names):
+    """
+    Extract which properties were violated (i.e. which goal subsets are reachable) from the output of nuXmv.
+    :param output: the output of nuXmv
+    :param property_names: the names of the properties in the model
+    :return: a list with True for each reachable goal subset and False otherwise
+    """
+    reachable = [False] * len(property_names)
+
+    # the specification line of a violated property is "-- specification !( F is_solvable_i)  is false"
+    for index, result in re.findall(r'-- specification .*is_solvable_([0-9]+)\s*\)\s+is (true|false)', output):
+        reachable[int(index)] = result == 'false'
+
+    return reachable
+
+def check_goal_subsets(board_to_read, k, goal_subsets=None, engine="SAT"):
+    """
+    Check in a single nuXmv session which goal subsets are reachable from the initial board.
+    The model is flattened and encoded once, and each subset is checked with its own property.
+    :param board_to_read: the board file to read
+    :param k: the bound for BMC
+    :param goal_subsets: a list of lists of goals to check, defaults to all the prefixes of the goals
+    :param engine: the engine to use ("SAT" or "BDD")
+    :return: a list of (goal subset, is reachable) and the run time of the session
+    """
+
+    name_of_board = board_to_read.split(".")[0]
+    goals, board = extract_goals_indexes(board_to_read)
+
+    if goal_subsets is None:
+        goal_subsets = [goals[:i + 1] for i in range(len(goals))]
+
+    smv_model, property_names = gen_board_goal_subsets(goal_subsets, board)
+
+    # get the current path
+    curr_path = os.getcwd()
+
+    #### CHANGE HERE TO THE PATH OF YOUR nuXmv BIN FOLDER ####
+    os.chdir(r'C:\Users\shoham\Documents\ENG_degree\Final Project\nuXmv-2.0.0-win64\bin')
+    # ^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+
+    with open(f"{name_of_board}_goal_subsets.smv", 'w') as f:
+        f.write(smv_model)
+
+    # return the path to the previous path
+    os.chdir(curr_path)
+
+    # RUN nuXmv once for all the subsets:
+    start_time = time.time()  # Record start time
+    output_file_name = run_nuXmv.run_nuxmv(f"{name_of_board}_goal_subsets.smv", k=k, engine=engine,
+                                           properties=property_names)
+    end_time = time.time()  # Record end time
+
+    #### CHANGE HERE TO THE PATH OF YOUR nuXmv BIN FOLDER ####
+    os.chdir(r'C:\Users\shoham\Documents\ENG_degree\Final Project\nuXmv-2.0.0-win64\bin')
+    # ^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+
+    with open(output_file_name, "r") as f:
+        output = f.read()
+
+    # Change directory back to the original directory
+    os.chdir(curr_path)
+
+    reachable = extract_property_results(output, property_names)
+
+    return list(zip(goal_subsets, reachable)), end_time - start_time
+
+def solve_board_iteratively(board_to_read, multi_property=False):
     """
     Solve the board iteratively using nuXmv.
     :param board_to_read: the board file to read
+    :param multi_property: if True, check all the goal prefixes in a single nuXmv session
+                           instead of running nuXmv once for each prefix
     :return: the run times of each iteration
     """
 
+    if multi_property:
+        k = input("Enter k Value for BMC:")
+        results, run_time = check_goal_subsets(board_to_read, k)
+
+        for goals_of_subset, reachable in results:
+            print(f"Goals {goals_of_subset} are {'reachable' if reachable else 'not reachable'} with k = {k}")
+
+        # the last prefix holds all the goals, so its result is the result of the board
+        if not results or not results[-1][1]:
+            print("There is no solution to this board")
+            return []
+
+        print(f"Total run time: {run_time:.3f} seconds")
+        return [(run_time, 1)]
+
     # extract from board all the goals
     name_of_board =board_to_read.split(".")[0]
     goals, board = extract_goals_indexes(board_to_read)
@@ -214,25 +374,12 @@ def solve_board_iteratively(board_to_read):
         goals_of_iteration.append(goal)
 
         # generate the SMV model for the current goals and the current board state
-        smv_model = gen_board_one_goal(goals_of_iteration, board)
-
-        # get the current path
-        curr_path = os.getcwd()
-
-        #### CHANGE HERE TO THE PATH OF YOUR nuXmv BIN FOLDER ####
-        os.chdir(r'C:\Users\shoham\Documents\ENG_degree\Final Project\nuXmv-2.0.0-win64\bin')
-        # ^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
-
-        with open(f"{name_of_board}_goals{goals_of_iteration}.smv", 'w') as f:
-            f.write(smv_model)
-
-        # return the path to the previous path
-        os.chdir(curr_path)
+        model_file_name = write_iteration_model(name_of_board, goals_of_iteration, board)
 
         # RUN nuXmv:
         k = input("Enter k Value for BMC:")
         start_time = time.time()  # Record start time
-        output_file_name = run_nuXmv.run_nuxmv(f"{name_of_board}_goals{goals_of_iteration}.smv", k=k, engine="SAT")
+        output_file_name = run_nuXmv.run_nuxmv(model_file_name, k=k, engine="SAT")
         end_time = time.time()  # Record end time
 
         # save the run time + iteration number of each iteration
@@ -251,3 +398,100 @@ def solve_board_iteratively(board_to_read):
 
     return run_times_lst
 
+
+
+def extract_bound_reached(output_file):
+    """
+    Extract the bound of the solution found by nuXmv (the number of moves of the iteration).
+    :param output_file: the output file from nuXmv
+    :return: the bound of the solution, or None if there is no solution
+    """
+
+    # save the current directory
+    cwd = os.getcwd()
+
+    #### CHANGE HERE TO THE LOCATION OF YOUR nuXmv BIN FOLDER ####
+    os.chdir(r'C:\Users\shoham\Documents\ENG_degree\Final Project\nuXmv-2.0.0-win64\bin')
+    # ^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+
+    with open(output_file, "r") as f:
+        trace = parse_nuxmv_output(f.read(), "SAT")
+
+    # Change directory back to the original directory
+    os.chdir(cwd)
+
+    return trace['k'] if trace['solved'] else None
+
+def next_batch_size(batch_size, run_time, bound, k, time_budget):
+    """
+    Choose the number of goals to add in the next iteration from the last iteration.
+    Fast iterations that used a small part of the bound double the batch, slow ones go back to a single goal.
+    :param batch_size: the number of goals added in the last iteration
+    :param run_time: the run time of the last iteration
+    :param bound: the bound of the solution of the last iteration, None if it's unknown
+    :param k: the bound for BMC
+    :param time_budget: the time budget of a single iteration in seconds
+    :return: the number of goals to add in the next iteration
+    """
+    # an iteration with an unknown bound isn't counted as fast
+    if run_time < FAST_ITERATION * time_budget and bound is not None and bound <= FAST_ITERATION * k:
+        return batch_size * 2
+    if run_time > SLOW_ITERATION * time_budget:
+        return 1
+    return batch_size
+
+def solve_board_adaptively(board_to_read, k, time_budget=60):
+    """
+    Solve the board iteratively using nuXmv, adding several goals in each iteration while the iterations are fast.
+    A batch of goals that can't be solved within k is split in half and tried again from the same board.
+    :param board_to_read: the board file to read
+    :param k: the bound for BMC of each iteration
+    :param time_budget: the time budget of a single iteration in seconds
+    :return: the run times of each iteration
+    """
+
+    # extract from board all the goals
+    name_of_board = board_to_read.split(".")[0]
+    goals, board = extract_goals_indexes(board_to_read)
+
+    run_times_lst = []
+    goals_of_iteration = []
+    batch_size = 1
+
+    while len(goals_of_iteration) < len(goals):
+        # add the next batch of goals
+        batch = goals[len(goals_of_iteration):len(goals_of_iteration) + batch_size]
+
+        # generate the SMV model for the current goals and the current board state
+        model_file_name = write_iteration_model(name_of_board, goals_of_iteration + batch, board)
+
+        # RUN nuXmv:
+        start_time = time.time()  # Record start time
+        output_file_name = run_nuXmv.run_nuxmv(model_file_name, k=k, engine="SAT")
+        end_time = time.time()  # Record end time
+
+        # save the run time + iteration number of each iteration
+        run_times_lst.append(((end_time - start_time), (len(run_times_lst) + 1)))
+
+        # create the new initial state
+        new_board = create_initial_state_iterative(board, output_file_name)
+
+        if new_board == -1:
+            # split the batch and try again from the same board
+            if len(batch) > 1:
+                batch_size = len(batch) // 2
+                continue
+            print("There is no solution to this board")
+            return []
+
+        board = new_board
+        goals_of_iteration += batch
+
+        bound = extract_bound_reached(output_file_name)
+        batch_size = next_batch_size(len(batch), end_time - start_time, bound, int(k), time_budget)
+
+    # print the total run time and the total number of iterations to solve the board:
+    print(f"Total run time: {sum([t for t, _ in run_times_lst]):.3f} seconds")
+    print(f"Total number of iterations: {len(run_times_lst)}")
+
+    return run_times_lst
@@ -0,0 +1,203 @@
+import os
+import re
+import json
+import time
+import asyncio
+from Model_Smv import read_from_text, create_smv_model, write_to_file
+from run_nuXmv import nuxmv_commands
+from trace_archive import board_hash, parse_nuxmv_output, archive_run
+
+#### CHANGE HERE TO THE PATH OF YOUR nuXmv BIN FOLDER ####
+NUXMV_BIN_PATH = r'C:\Users\shoham\Documents\ENG_degree\Final Project\nuXmv-2.0.0-win64\bin'
+# ^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+
+
+class SolveService:
+    """
+    Local asyncio service that solves Sokoban boards with nuXmv.
+
+    Clients connect to a localhost TCP port and send one JSON line per request:
+        {"board": "<XSB board text>", "engine": "SAT" or "BDD", "k": <bound for the SAT engine>}
+    The service answers with JSON lines:
+        {"type": "progress", "bound": N, "message": "bound N done"}   - for each bound finished by BMC
+        {"type": "result", "solved": ..., "moves": [...], "k": ..., "time": ...} - when the solve ends
+        {"type": "error", "message": "..."}                          - if the request can't be served
+    Requests for the same board, engine and k that arrive while a solve is running
+    share that solve instead of starting a new nuXmv process.
+    """
+
+    def __init__(self, max_processes=2, max_pending=16, archive_path=None):
+        """
+        :param max_processes: the maximal number of nuXmv processes running at the same time
+        :param max_pending: the maximal number of different solves that wait or run at the same time,
+                            new solves are rejected when it's reached
+        :param archive_path: the trace archive to save the results in, None to skip it
+        """
+        self.max_pending = max_pending
+        self.archive_path = archive_path
+        self.process_slots = asyncio.Semaphore(max_processes)
+        # solves that are waiting or running, by (board hash, engine, k)
+        self.in_flight = {}
+
+    def solve(self, board_text, engine, k):
+        """
+        Get the solve of a board, joining the running solve of the same board if there is one.
+        :param board_text: the XSB text of the board
+        :param engine: "SAT" or "BDD"
+        :param k: the bound for the SAT engine (ignored for the BDD engine)
+        :return: the solve as a dictionary with the list of subscribers (queues) and its task
+        """
+        board = read_from_text(board_text)
+        if not board:
+            raise ValueError("The board is empty")
+        if engine not in ('SAT', 'BDD'):
+            raise ValueError(f"Unknown engine {engine}")
+        if engine == 'SAT':
+            k = int(k)
+        else:
+            k = None
+
+        key = (board_hash(board), engine, k)
+
+        # coalesce with the solve that is already running for this board
+        if key in self.in_flight:
+            return self.in_flight[key]
+
+        # backpressure - don't queue more solves than we can handle
+        if len(self.in_flight) >= self.max_pending:
+            raise RuntimeError("The service is busy, try again later")
+
+        solve = {'subscribers': [], 'bound': None}
+        self.in_flight[key] = solve
+        solve['task'] = asyncio.ensure_future(self.run_solve(key, board, engine, k, solve))
+        return solve
+
+    def publish(self, solve, message):
+        """
+        Send a message to all the clients waiting for a solve.
+        :param solve: the solve
+        :param message: the message as a dictionary
+        """
+        for queue in solve['subscribers']:
+            queue.put_nowait(message)
+
+    async def run_solve(self, key, board, engine, k, solve):
+        """
+        Generate the model of the board and run nuXmv on it, streaming the finished bounds.
+        :param key: the key of the solve in in_flight
+        :param board: the board of the current Sokoban game
+        :param engine: "SAT" or "BDD"
+        :param k: the bound for the SAT engine
+        :param solve: the solve
+        :return: the result message
+        """
+        try:
+            # each solve (board, engine and k) gets its own model file so solves don't override each other
+            bound = "" if k is None else f"_k{k}"
+            model_file_name = f"sokoban_model_{key[0].hex()[:12]}_{engine}{bound}.smv"
+            write_to_file(os.path.join(NUXMV_BIN_PATH, model_file_name), create_smv_model(board))
+
+            async with self.process_slots:
+                start_time = time.time()
+                args, commands = nuxmv_commands(model_file_name, k, engine)
+                # cwd doesn't change how the executable is found (on Windows), so give its full path
+                args = [os.path.normpath(os.path.join(NUXMV_BIN_PATH, args[0]))] + args[1:]
+                nuxmv_process = await asyncio.create_subprocess_exec(
+                    *args, cwd=NUXMV_BIN_PATH, stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE)
+                nuxmv_process.stdin.write(commands.encode())
+                await nuxmv_process.stdin.drain()
+                nuxmv_process.stdin.close()
+
+                # read the output line by line to report the bounds as they finish
+                output = []
+                async for line in nuxmv_process.stdout:
+                    line = line.decode(errors='replace')
+                    output.append(line)
+                    bound = re.findall(r'no counterexample found with bound (\d+)', line)
+                    if bound:
+                        solve['bound'] = int(bound[0])
+                        self.publish(solve, {'type': 'progress', 'bound': int(bound[0]),
+                                             'message': f"bound {bound[0]} done"})
+
+                await nuxmv_process.wait()
+                total_time = time.time() - start_time
+
+            output = ''.join(output)
+
+            # save the output next to the model, as run_nuxmv does
+            write_to_file(os.path.join(NUXMV_BIN_PATH, model_file_name.split(".")[0] + ".out"), output)
+
+            trace = parse_nuxmv_output(output, engine)
+
+            # save the result and the running time (in a thread, the archive may be locked by another process)
+            if self.archive_path is not None:
+                await asyncio.to_thread(archive_run, self.archive_path, output, board, engine, [total_time])
+
+            result = {'type': 'result', 'solved': trace['solved'], 'moves': trace['moves'],
+                      'k': trace['k'], 'time': total_time}
+        except Exception as e:
+            result = {'type': 'error', 'message': str(e)}
+        finally:
+            # new requests for this board start a new solve from now on
+            del self.in_flight[key]
+
+        self.publish(solve, result)
+        return result
+
+    async def handle_client(self, reader, writer):
+        """
+        Serve the requests of a single client connection.
+        :param reader: the stream reader of the connection
+        :param writer: the stream writer of the connection
+        """
+        try:
+            async for line in reader:
+                if not line.strip():
+                    continue
+
+                queue = asyncio.Queue()
+                try:
+                    request = json.loads(line)
+                    solve = self.solve(request['board'], request.get('engine', 'SAT'), request.get('k'))
+                except (ValueError, KeyError, TypeError, RuntimeError) as e:
+                    writer.write((json.dumps({'type': 'error', 'message': str(e)}) + '\n').encode())
+                    await writer.drain()
+                    continue
+
+                # a client that joins a running solve first gets the last finished bound
+                solve['subscribers'].append(queue)
+                if solve['bound'] is not None:
+                    queue.put_nowait({'type': 'progress', 'bound': solve['bound'],
+                                      'message': f"bound {solve['bound']} done"})
+
+                while True:
+                    message = await queue.get()
+                    writer.write((json.dumps(message) + '\n').encode())
+                    # wait for slow clients instead of buffering without limit
+                    await writer.drain()
+                    if message['type'] != 'progress':
+                        break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host='127.0.0.1', port=8765):
+        """
+        Run the service until it's cancelled.
+        :param host: the address to listen on (localhost by default)
+        :param port: the port to listen on
+        """
+        server = await asyncio.start_server(self.handle_client, host, port)
+        print(f"Solve service listening on {host}:{port}")
+        async with server:
+            await server.serve_forever()
+
+
+if __name__ == '__main__':
+    #### CHANGE HERE TO THE PORT AND THE MAXIMAL NUMBER OF nuXmv PROCESSES ####
+    port = 8765
+    max_processes = 2
+    archive_file = 'sokoban_traces.arc'  # None to keep only the .out files
+    # ^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+    asyncio.run(SolveService(max_processes=max_processes, archive_path=archive_file).serve(port=port))
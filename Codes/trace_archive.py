@@ -0,0 +1,442 @@
+import os
+import re
+import mmap
+import time
+import zlib
+import struct
+import hashlib
+from Model_Smv import read_from_file
+
+# ^^^^^^^^^^^^^^^^^^^^^^^^^^^^ ARCHIVE LAYOUT ^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+# [magic][record 0][record 1]...[record N-1][index][trailer]
+#   record  - zlib compressed payload (see pack_trace)
+#   index   - N fixed size entries sorted by board hash: (hash, engine, offset, length)
+#   trailer - (index offset, number of entries, magic) so a reader can find the index
+#             from the end of the file without scanning the records
+# appends never overwrite: they add [new records][index of all the records][trailer] after the
+# last trailer, so an append that was cut in the middle leaves the previous trailer valid
+# ^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+
+ARCHIVE_MAGIC = b'SOKOTRC1'
+INDEX_ENTRY = struct.Struct('<20sBQI')
+TRAILER = struct.Struct('<QI8s')
+
+# the engines are stored as a single byte in the index
+ENGINES = ['SAT', 'BDD', None]
+
+# the cell values of the SMV model, in the same order as the game_board enum
+CELL_STATES = ['Wall', 'Player', 'PonGoal', 'Box', 'BonGoal', 'Goal', 'Floor']
+
+# the XSB symbol of each cell value (used to rebuild the board from State 1.1)
+CELL_TO_XSB = {'Wall': '#', 'Player': '@', 'PonGoal': '+', 'Box': '$',
+               'BonGoal': '*', 'Goal': '.', 'Floor': '-'}
+
+NO_BOUND = 0xFFFF
+
+
+def board_hash(board):
+    """
+    Compute the hash that identifies a board in the archive.
+    :param board: the board of the current Sokoban game (2D list of XSB characters)
+    :return: 20 bytes sha1 digest of the board
+    """
+    board_text = '\n'.join(''.join(row) for row in board)
+    return hashlib.sha1(board_text.encode('ascii')).digest()
+
+
+def parse_nuxmv_output(output, engine=None):
+    """
+    Parse the stdout of a nuXmv run into a compact trace.
+    Only the cells that change between states are kept, the static walls of State 1.1 are dropped.
+    :param output: the text of the nuXmv .out file
+    :param engine: "SAT" or "BDD", if None it is guessed from the trace description
+    :return: a dictionary with the trace (see pack_trace for the fields)
+    """
+
+    # guess the engine from the type of the counterexample
+    if engine is None:
+        if 'BMC Counterexample' in output or 'no counterexample found with bound' in output:
+            engine = 'SAT'
+        elif 'LTL Counterexample' in output:
+            engine = 'BDD'
+
+    # the bounds that were checked by the BMC engine
+    bounds = [int(bound) for bound in re.findall(r'no counterexample found with bound (\d+)', output)]
+
+    # list of states, each state is a list of (row, col, value) and the movement of the state
+    states = []
+    movement = None
+    solved_state = None
+
+    for line in output.split('\n'):
+        if '-> State:' in line:
+            # the movement keeps its value when nuXmv doesn't print it
+            states.append({'cells': [], 'movement': movement})
+        elif 'Loop starts here' in line or not states:
+            continue
+        elif 'game_board' in line:
+            cell = re.findall(r'\[([0-9]+)\]\[([0-9]+)\] = (\w+)', line)
+            if cell:
+                row, col, value = cell[0]
+                states[-1]['cells'].append((int(row), int(col), value))
+        elif 'movement =' in line:
+            movement = line.split('=')[-1].strip()
+            states[-1]['movement'] = movement
+        elif 'is_solvable' in line and 'TRUE' in line and solved_state is None:
+            solved_state = len(states) - 1
+
+    solved = solved_state is not None
+
+    # keep only the states until the board is solved (nuXmv continues the loop after that)
+    if solved:
+        states = states[:solved_state + 1]
+
+    if not states:
+        return {'board': [], 'engine': engine, 'k': max(bounds) if bounds else None,
+                'solved': False, 'timings': [], 'moves': [], 'steps': []}
+
+    # rebuild the initial board from State 1.1
+    n = max(row for row, _, _ in states[0]['cells']) + 1
+    m = max(col for _, col, _ in states[0]['cells']) + 1
+    board = [['#'] * m for _ in range(n)]
+    for row, col, value in states[0]['cells']:
+        board[row][col] = CELL_TO_XSB[value]
+
+    # the first step holds the non wall cells of the initial state, the walls are implied
+    steps = [[cell for cell in states[0]['cells'] if cell[2] != 'Wall']]
+    steps += [state['cells'] for state in states[1:]]
+
+    # the movement of a state is the one taken to get to the next state
+    moves = [state['movement'] for state in states[:-1]]
+
+    if solved:
+        k = len(states) - 1
+    else:
+        k = max(bounds) if bounds else None
+
+    return {'board': board, 'engine': engine, 'k': k, 'solved': solved,
+            'timings': [], 'moves': moves, 'steps': steps}
+
+
+def pack_trace(trace):
+    """
+    Pack a trace into the compressed binary record stored in the archive.
+    :param trace: dictionary with the keys board, engine, k, solved, timings, moves and steps
+    :return: the compressed record as bytes
+    """
+    board = trace['board']
+    n = len(board)
+    m = len(board[0]) if n else 0
+    k = NO_BOUND if trace['k'] is None else int(trace['k'])
+
+    # header: board hash, engine, k, solved flag, board size and timings
+    payload = struct.pack('<20sBHBHH', board_hash(board), ENGINES.index(trace['engine']), k,
+                          int(trace['solved']), n, m)
+    payload += struct.pack('<H', len(trace['timings']))
+    payload += struct.pack(f'<{len(trace["timings"])}d', *trace['timings'])
+
+    # movement sequence, one character per move
+    moves = ''.join(trace['moves']).encode('ascii')
+    payload += struct.pack('<H', len(moves)) + moves
+
+    # per step cell deltas
+    payload += struct.pack('<H', len(trace['steps']))
+    for step in trace['steps']:
+        payload += struct.pack('<H', len(step))
+        for row, col, value in step:
+            payload += struct.pack('<HHB', row, col, CELL_STATES.index(value))
+
+    return zlib.compress(payload, 9)
+
+
+def unpack_trace(record):
+    """
+    Unpack a compressed record of the archive back into a trace.
+    :param record: the compressed record as bytes
+    :return: dictionary with the trace, the board itself is replaced by its hash and size
+    """
+    payload = zlib.decompress(record)
+
+    digest, engine, k, solved, n, m = struct.unpack_from('<20sBHBHH', payload, 0)
+    offset = struct.calcsize('<20sBHBHH')
+
+    num_timings, = struct.unpack_from('<H', payload, offset)
+    offset += 2
+    timings = list(struct.unpack_from(f'<{num_timings}d', payload, offset))
+    offset += 8 * num_timings
+
+    num_moves, = struct.unpack_from('<H', payload, offset)
+    offset += 2
+    moves = list(payload[offset:offset + num_moves].decode('ascii'))
+    offset += num_moves
+
+    num_steps, = struct.unpack_from('<H', payload, offset)
+    offset += 2
+    steps = []
+    for _ in range(num_steps):
+        num_cells, = struct.unpack_from('<H', payload, offset)
+        offset += 2
+        step = []
+        for _ in range(num_cells):
+            row, col, value = struct.unpack_from('<HHB', payload, offset)
+            offset += struct.calcsize('<HHB')
+            step.append((row, col, CELL_STATES[value]))
+        steps.append(step)
+
+    return {'board_hash': digest, 'size': (n, m), 'engine': ENGINES[engine],
+            'k': None if k == NO_BOUND else k, 'solved': bool(solved),
+            'timings': timings, 'moves': moves, 'steps': steps}
+
+
+def write_archive(archive_path, traces):
+    """
+    Write traces to a new archive file with an offset index sorted by board hash.
+    :param archive_path: the path of the archive file
+    :param traces: list of traces (as returned from parse_nuxmv_output)
+    :return: the number of traces written
+    """
+    entries = []
+
+    with open(archive_path, 'wb') as archive:
+        archive.write(ARCHIVE_MAGIC)
+
+        for trace in traces:
+            record = pack_trace(trace)
+            entries.append((board_hash(trace['board']), ENGINES.index(trace['engine']),
+                            archive.tell(), len(record)))
+            archive.write(record)
+
+        # the index is sorted so a board can be found with a binary search
+        entries.sort()
+        index_offset = archive.tell()
+        for entry in entries:
+            archive.write(INDEX_ENTRY.pack(*entry))
+
+        archive.write(TRAILER.pack(index_offset, len(entries), ARCHIVE_MAGIC))
+
+    return len(entries)
+
+
+def lock_archive(archive_path, timeout=60):
+    """
+    Take the lock of an archive so processes that append to it at the same time don't mix their records.
+    :param archive_path: the path of the archive file
+    :param timeout: seconds to wait for the lock before taking it over (from a process that died)
+    :return: the path of the lock file, remove it to release the lock
+    """
+    lock_path = archive_path + '.lock'
+    start_time = time.time()
+
+    while True:
+        try:
+            os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return lock_path
+        except FileExistsError:
+            if time.time() - start_time > timeout:
+                # the process holding the lock died without releasing it
+                os.remove(lock_path)
+            else:
+                time.sleep(0.05)
+
+
+def find_trailer(archive):
+    """
+    Find the last complete trailer of an archive, skipping the bytes of an append that didn't finish.
+    :param archive: the content of the archive file (bytes or mmap)
+    :return: the offset of the index, the number of entries and the offset of the end of the trailer
+    """
+    if archive[:len(ARCHIVE_MAGIC)] != ARCHIVE_MAGIC:
+        raise ValueError("Not a Sokoban trace archive")
+
+    end = len(archive)
+    while end >= len(ARCHIVE_MAGIC) + TRAILER.size:
+        index_offset, num_entries, magic = TRAILER.unpack_from(archive, end - TRAILER.size)
+        # a trailer ends right after its index
+        if magic == ARCHIVE_MAGIC and index_offset + num_entries * INDEX_ENTRY.size == end - TRAILER.size:
+            return index_offset, num_entries, end
+
+        # look for the magic of an earlier trailer
+        magic_offset = archive.rfind(ARCHIVE_MAGIC, len(ARCHIVE_MAGIC), end - 1)
+        if magic_offset == -1:
+            break
+        end = magic_offset + len(ARCHIVE_MAGIC)
+
+    raise ValueError("Not a Sokoban trace archive")
+
+
+def append_to_archive(archive_path, traces):
+    """
+    Add traces to an archive, creating it if it doesn't exist.
+    The new records, the index of all the records and a new trailer are written after the last trailer,
+    so the archive stays readable if the process dies in the middle.
+    :param archive_path: the path of the archive file
+    :param traces: list of traces (as returned from parse_nuxmv_output)
+    :return: the number of traces in the archive
+    """
+    lock_path = lock_archive(archive_path)
+    try:
+        if not os.path.exists(archive_path) or os.path.getsize(archive_path) == 0:
+            return write_archive(archive_path, traces)
+
+        with open(archive_path, 'r+b') as archive:
+            # read the current index
+            with mmap.mmap(archive.fileno(), 0, access=mmap.ACCESS_READ) as content:
+                index_offset, num_entries, end = find_trailer(content)
+                entries = [INDEX_ENTRY.unpack_from(content, index_offset + i * INDEX_ENTRY.size)
+                           for i in range(num_entries)]
+
+            # the new records start after the last trailer (dropping what an append that died left after it)
+            archive.seek(end)
+            archive.truncate()
+            for trace in traces:
+                record = pack_trace(trace)
+                entries.append((board_hash(trace['board']), ENGINES.index(trace['engine']),
+                                archive.tell(), len(record)))
+                archive.write(record)
+
+            entries.sort()
+            index_offset = archive.tell()
+            for entry in entries:
+                archive.write(INDEX_ENTRY.pack(*entry))
+
+            archive.write(TRAILER.pack(index_offset, len(entries), ARCHIVE_MAGIC))
+    finally:
+        os.remove(lock_path)
+
+    return len(entries)
+
+
+def archive_run(archive_path, output, board, engine, timings, moves=None):
+    """
+    Save the result of a nuXmv run in an archive.
+    :param archive_path: the path of the archive file
+    :param output: the output of nuXmv
+    :param board: the board that was solved (the hash of the record is computed from it)
+    :param engine: "SAT" or "BDD"
+    :param timings: list of the running times of the run in seconds
+    :param moves: the player movements to save instead of the ones of the trace (e.g. expanded tunnel moves)
+    :return: the number of traces in the archive
+    """
+    trace = parse_nuxmv_output(output, engine)
+    trace['board'] = board
+    trace['timings'] = [float(t) for t in timings]
+    if moves is not None:
+        trace['moves'] = moves
+
+    return append_to_archive(archive_path, [trace])
+
+
+def read_index(archive):
+    """
+    Read the location of the index from the trailer of a mapped archive.
+    :param archive: the mmap of the archive file
+    :return: the offset of the index and the number of entries
+    """
+    index_offset, num_entries, _ = find_trailer(archive)
+    return index_offset, num_entries
+
+
+def lookup_trace(archive_path, board, engine=None):
+    """
+    Find the traces of a board in the archive without scanning the records.
+    :param archive_path: the path of the archive file
+    :param board: the board (2D list) or its hash as returned from board_hash
+    :param engine: return only the traces of this engine ("SAT" or "BDD"), None for all of them
+    :return: list of traces of the board
+    """
+    digest = board if isinstance(board, bytes) else board_hash(board)
+    traces = []
+
+    with open(archive_path, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as archive:
+            index_offset, num_entries = read_index(archive)
+
+            # binary search for the first entry of the board
+            low, high = 0, num_entries
+            while low < high:
+                mid = (low + high) // 2
+                entry_hash = INDEX_ENTRY.unpack_from(archive, index_offset + mid * INDEX_ENTRY.size)[0]
+                if entry_hash < digest:
+                    low = mid + 1
+                else:
+                    high = mid
+
+            # collect all the entries of the board
+            for i in range(low, num_entries):
+                entry_hash, entry_engine, offset, length = INDEX_ENTRY.unpack_from(
+                    archive, index_offset + i * INDEX_ENTRY.size)
+                if entry_hash != digest:
+                    break
+                if engine is not None and ENGINES[entry_engine] != engine:
+                    continue
+                traces.append(unpack_trace(archive[offset:offset + length]))
+
+    return traces
+
+
+def output_board_file(file_name, boards_dir):
+    """
+    Find the board file of a saved nuXmv output from its name (e.g. sokoban_model_Borad2_SAT_engine.out -> board2.txt).
+    :param file_name: the name of the .out file
+    :param boards_dir: the directory of the board files
+    :return: the path of the board file, None if the name doesn't hold a board number
+    """
+    number = re.findall(r'Bo(?:ar|ra)d(\d+)', file_name)
+    if not number:
+        return None
+
+    board_file = os.path.join(boards_dir, f"board{number[0]}.txt")
+    return board_file if os.path.exists(board_file) else None
+
+
+def convert_outputs(output_dirs, archive_path, boards_dir='../Sokoban_Boards'):
+    """
+    Convert the nuXmv .out files in the given directories into a single archive.
+    :param output_dirs: list of directories to search (recursively) for .out files
+    :param archive_path: the path of the archive file to create
+    :param boards_dir: the directory of the board files, used for the runs without a trace
+    :return: the number of converted files
+    """
+    traces = []
+
+    for output_dir in output_dirs:
+        for root, _, files in os.walk(output_dir):
+            for file_name in sorted(files):
+                if not file_name.endswith('.out'):
+                    continue
+
+                # the iterative outputs solve only some of the goals, starting from the board of the previous
+                # iteration, so they aren't solutions of any board file
+                if '_goals[' in file_name:
+                    continue
+
+                # the engine is part of the name of the saved outputs (e.g. sokoban_model_Borad1_SAT_engine.out)
+                engine = None
+                if 'SAT_engine' in file_name:
+                    engine = 'SAT'
+                elif 'BDD_engine' in file_name:
+                    engine = 'BDD'
+
+                with open(os.path.join(root, file_name), 'r') as f:
+                    output = f.read()
+                    trace = parse_nuxmv_output(output, engine)
+
+                # runs without a path to win have no trace to rebuild the board from, take it from the board file
+                board_file = output_board_file(file_name, boards_dir)
+                if board_file is not None:
+                    trace['board'] = read_from_file(board_file)
+
+                # skip outputs that checked nothing (e.g. nuXmv errors) or whose board is unknown
+                checked = trace['solved'] or trace['k'] is not None or 'is true' in output
+                if trace['board'] and trace['engine'] is not None and checked:
+                    traces.append(trace)
+
+    return write_archive(archive_path, traces)
+
+
+if __name__ == '__main__':
+    #### CHANGE HERE TO THE FOLDERS OF THE .out FILES AND THE ARCHIVE PATH ####
+    folders = ['../Part 2 Outputs', '../Part 3 Outputs', '../Part 4 Outputs']
+    archive_file = 'sokoban_traces.arc'
+    # ^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+    print(f"Converted {convert_outputs(folders, archive_file)} output files into {archive_file}")